@@ -0,0 +1,183 @@
+# fluid_gui.py
+# pygame front-end for the fluid demo: left pane shows a field, right panel
+# shows parameters/stats. Drag the mouse to splat dye + momentum.
+import numpy as np
+import pygame
+
+from fluid_langrangians import FluidSim
+from colormaps import (DYE_LUT, VIRIDIS_LUT, DIVERGING_LUT,
+                       field_to_rgb_transposed, velocity_arrows)
+
+_MODES = ('dye', 'vorticity', 'divergence', 'velocity')
+
+class FluidGUI:
+    def __init__(self, N=128, sim_size=512, panel_width=220, fps=60):
+        pygame.init()
+        self.N = N; self.sim_size = sim_size
+        self.panel_width = panel_width; self.fps = fps
+        # SCALED lets SDL present through GPU-accelerated blits; DOUBLEBUF
+        # avoids tearing on drivers that honour it
+        self.screen = pygame.display.set_mode(
+            (sim_size + panel_width, sim_size),
+            pygame.SCALED | pygame.DOUBLEBUF)
+        pygame.display.set_caption("fermi-fluids-intro")
+        self.clock = pygame.time.Clock()
+        self.font = pygame.font.SysFont("monospace", 13)
+        self.sim = FluidSim(N=N)
+        self.display_mode = 'dye'
+        self.paused = False
+        self._last_mouse = None
+        # the colormapped field lands on a small NxN surface and SDL's
+        # C blitter stretches it into a preallocated destination surface;
+        # no field-sized numpy upscale per frame
+        self._sim_surf_small = pygame.Surface((N, N))
+        self._sim_surf_big = pygame.Surface((sim_size, sim_size))
+        self._stats_cache = None
+        # dirty-rect bookkeeping: the sim pane is presented every frame, the
+        # panel only when the frame it was drawn for goes stale
+        self._sim_rect = pygame.Rect(0, 0, sim_size, sim_size)
+        self._panel_rect = pygame.Rect(sim_size, 0, panel_width, sim_size)
+        self._panel_frame = -1
+        self._panel_mode = None
+        # rendered-text cache: static labels rasterize once, dynamic stats
+        # strings churn through and age out via the LRU cap
+        self._text_cache = {}
+        self._seed_initial_state()
+
+    def _seed_initial_state(self):
+        rng = np.random.default_rng(7)
+        xs, ys = rng.random(3), rng.random(3)
+        angs = rng.random(3)*2*np.pi
+        self.sim.add_splats_batched(xs, ys, np.ones(3),
+                                    np.cos(angs)*0.6, np.sin(angs)*0.6,
+                                    radius=0.07)
+
+    # ---------- rendering ----------
+    def _field_to_surface(self, indices, lut):
+        # LUT-gather and transpose in one kernel pass writing through a
+        # zero-copy view of the persistent surface's pixel buffer; the view
+        # must be dropped before SDL may blit the surface
+        arr = pygame.surfarray.pixels3d(self._sim_surf_small)
+        field_to_rgb_transposed(indices, lut,
+                                np.float32(0.0), np.float32(1.0), arr)
+        del arr
+        pygame.transform.scale(self._sim_surf_small,
+                               (self.sim_size, self.sim_size),
+                               self._sim_surf_big)
+        return self._sim_surf_big
+
+    def _draw_simulation(self):
+        # the sim hands over uint8 LUT indices, so the display path is a
+        # byte gather + transpose with no float arithmetic in the GUI
+        indices = self.sim.get_display_indices()
+        mode = self.display_mode
+        if mode == 'dye':
+            surf = self._field_to_surface(indices['dye'], DYE_LUT)
+        elif mode == 'vorticity':
+            surf = self._field_to_surface(indices['vorticity'], DIVERGING_LUT)
+        elif mode == 'divergence':
+            surf = self._field_to_surface(indices['divergence'], DIVERGING_LUT)
+        else:  # velocity
+            surf = self._field_to_surface(indices['velocity_mag'], VIRIDIS_LUT)
+        self.screen.blit(surf, (0, 0))
+        if mode == 'velocity':
+            # scale/round/bounds-check all segments in numpy; python only
+            # issues the draw calls
+            scale = self.sim_size / self.N
+            pts = (velocity_arrows(self.sim.u, self.sim.v)*scale).astype(np.int32)
+            lim = self.sim_size
+            ok = ((pts >= 0) & (pts < lim)).all(axis=1)
+            for x1, y1, x2, y2 in pts[ok].tolist():
+                pygame.draw.line(self.screen, (255, 255, 255),
+                                 (x1, y1), (x2, y2), 1)
+
+    _TEXT_CACHE_MAX = 200
+
+    def _draw_text(self, text, x, y, color=(230, 230, 230)):
+        # glyph rasterization dominates panel cost, so reuse rendered
+        # surfaces; dict order doubles as recency for LRU eviction
+        cache = self._text_cache
+        key = (text, color)
+        surf = cache.pop(key, None)
+        if surf is None:
+            surf = self.font.render(text, True, color)
+            if len(cache) >= self._TEXT_CACHE_MAX:
+                del cache[next(iter(cache))]
+        cache[key] = surf
+        self.screen.blit(surf, (x, y))
+
+    def _draw_panel(self):
+        x0 = self.sim_size
+        pygame.draw.rect(self.screen, (24, 24, 28),
+                         (x0, 0, self.panel_width, self.sim_size))
+        x = x0 + 10; y = 10
+        # stats only change when the sim advances; reuse them across redraws
+        stats = self._stats_cache
+        if stats is None or stats['frame'] != self.sim.frame:
+            stats = self._stats_cache = self.sim.get_stats()
+        self._draw_text("Statistics:", x, y); y += 18
+        self._draw_text(f"frame      {stats['frame']}", x, y); y += 16
+        self._draw_text(f"fps        {self.clock.get_fps():5.1f}", x, y); y += 16
+        self._draw_text(f"max |v|    {stats['max_velocity']:.3f}", x, y); y += 16
+        self._draw_text(f"max dye    {stats['max_dye']:.3f}", x, y); y += 16
+        self._draw_text(f"L2(div)    {stats['divergence_l2']:.4f}", x, y); y += 24
+        self._draw_text("Parameters:", x, y); y += 18
+        self._draw_text(f"N          {self.sim.N}", x, y); y += 16
+        self._draw_text(f"dt         {float(self.sim.dt):.3f}", x, y); y += 16
+        self._draw_text(f"vorticity  {self.sim.vort_strength:.1f}", x, y); y += 16
+        self._draw_text(f"solver     {self.sim.pressure_solver}", x, y); y += 24
+        self._draw_text(f"mode: {self.display_mode}", x, y); y += 24
+        self._draw_text("Keys:", x, y); y += 18
+        self._draw_text("1-4  display mode", x, y); y += 16
+        self._draw_text("spc  pause", x, y); y += 16
+        self._draw_text("r    reset", x, y); y += 16
+        self._draw_text("drag to splat", x, y)
+
+    # ---------- input ----------
+    def _splat_at(self, pos, rel):
+        px, py = pos
+        if px >= self.sim_size:
+            return
+        x = px / self.sim_size
+        y = py / self.sim_size
+        fx = rel[0]/self.sim_size * 40.0
+        fy = rel[1]/self.sim_size * 40.0
+        self.sim.add_splat(x, y, radius=0.05, amount=0.8, fx=fx, fy=fy)
+
+    def _handle_events(self):
+        for event in pygame.event.get():
+            if event.type == pygame.QUIT:
+                return False
+            if event.type == pygame.KEYDOWN:
+                if event.key == pygame.K_ESCAPE:
+                    return False
+                if event.key == pygame.K_SPACE:
+                    self.paused = not self.paused
+                elif event.key == pygame.K_r:
+                    self.sim.reset(); self._seed_initial_state()
+                elif pygame.K_1 <= event.key <= pygame.K_4:
+                    self.display_mode = _MODES[event.key - pygame.K_1]
+            if event.type == pygame.MOUSEMOTION and event.buttons[0]:
+                self._splat_at(event.pos, event.rel)
+        return True
+
+    def run(self):
+        running = True
+        while running:
+            running = self._handle_events()
+            if not self.paused:
+                self.sim.step()
+            self._draw_simulation()
+            dirty = [self._sim_rect]
+            if (self.sim.frame != self._panel_frame
+                    or self.display_mode != self._panel_mode):
+                self._draw_panel()
+                self._panel_frame = self.sim.frame
+                self._panel_mode = self.display_mode
+                dirty.append(self._panel_rect)
+            pygame.display.update(dirty)
+            self.clock.tick(self.fps)
+        pygame.quit()
+
+if __name__ == "__main__":
+    FluidGUI().run()
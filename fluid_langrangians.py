@@ -1,6 +1,27 @@
 # pure_numpy_fluid.py
 # 2D incompressible flow with semi-Lagrangian advection, vorticity confinement, Jacobi projection.
 import numpy as np, math
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from numba import njit, prange
+from scipy import fft as sfft
+from scipy.ndimage import map_coordinates
+
+# ---------- backend dispatch ----------
+def _array_module(a):
+    # numpy by default; cupy when the field lives on the GPU. The slicing
+    # operators below work on either thanks to __array_function__ dispatch;
+    # only the numba kernels and the FFTs need explicit routing.
+    if type(a).__module__.split('.')[0] == 'cupy':
+        import cupy
+        return cupy
+    return np
+
+def _fft_module(a):
+    if _array_module(a) is not np:
+        import cupyx.scipy.fft
+        return cupyx.scipy.fft
+    return sfft
 
 # ---------- boundaries ----------
 def enforce_no_through(u, v):
@@ -8,99 +29,637 @@ def enforce_no_through(u, v):
     v[0, :] = 0.0; v[-1, :] = 0.0
 
 # ---------- operators ----------
-def divergence(u, v):
-    div = np.zeros_like(u)
-    div[1:-1,1:-1] = 0.5*((u[1:-1,2:]-u[1:-1,:-2]) + (v[2:,1:-1]-v[:-2,1:-1]))
-    div[:,0]   = u[:,1]-u[:,0]
-    div[:,-1]  = u[:,-1]-u[:,-2]
-    div[0,:]  += v[1,:]-v[0,:]
-    div[-1,:] += v[-1,:]-v[-2,:]
-    return div
+def divergence(u, v, out=None):
+    # edge padding makes the central difference degrade to a one-sided
+    # difference at the walls, so one stencil covers interior and borders
+    xp = _array_module(u)
+    u_pad = xp.pad(u, 1, mode='edge'); v_pad = xp.pad(v, 1, mode='edge')
+    if out is None:
+        out = xp.empty_like(u)
+    xp.subtract(u_pad[1:-1, 2:], u_pad[1:-1, :-2], out=out)
+    out += v_pad[2:, 1:-1]; out -= v_pad[:-2, 1:-1]
+    out *= 0.5
+    return out
+
+@njit(parallel=True, fastmath=True, cache=True)
+def _jacobi_sweep_nb(p, p_new, div):
+    # one Jacobi iteration: rows are independent, so the interior sweep
+    # parallelizes over i; Neumann boundary copies fold into the same pass
+    N = p.shape[0]
+    for i in prange(1, N-1):
+        for j in range(1, N-1):
+            p_new[i, j] = 0.25*(p[i, j+1] + p[i, j-1]
+                                + p[i+1, j] + p[i-1, j] - div[i, j])
+    for i in prange(1, N-1):
+        p_new[i, 0] = p_new[i, 1]
+        p_new[i, N-1] = p_new[i, N-2]
+    for j in prange(N):
+        p_new[0, j] = p_new[1, j]
+        p_new[N-1, j] = p_new[N-2, j]
 
 def jacobi_pressure(div, iters=60):
-    p = np.zeros_like(div)
+    # reference solver; project() uses the in-place red-black kernel.
+    # Ping-pong between two preallocated buffers instead of allocating a
+    # fresh array per iteration.
+    buf = [np.zeros_like(div), np.empty_like(div)]
+    idx = 0
     for _ in range(iters):
-        p_new = np.zeros_like(p)
-        p_new[1:-1,1:-1] = 0.25*(p[1:-1,2:]+p[1:-1,:-2]+p[2:,1:-1]+p[:-2,1:-1]-div[1:-1,1:-1])
-        p_new[:,0]  = p_new[:,1]
-        p_new[:,-1] = p_new[:,-2]
-        p_new[0,:]  = p_new[1,:]
-        p_new[-1,:] = p_new[-2,:]
-        p = p_new
-    return p
-
-def project(u, v, iters=60):
+        _jacobi_sweep_nb(buf[idx], buf[idx ^ 1], div)
+        idx ^= 1
+    return buf[idx]
+
+@njit(parallel=True, fastmath=True, cache=True)
+def _rbgs_pressure(p, div, iters, omega):
+    # in-place red-black successive over-relaxation: converges ~2x faster per
+    # iteration than Jacobi and allocates nothing. Cells of one color only
+    # read the other color, so each half-sweep parallelizes safely.
+    #
+    # The sweep is tiled and each tile runs a couple of iterations before
+    # moving on (temporal blocking): a 64x64 fp32 tile stays resident in L1/L2
+    # across the inner iterations instead of being refetched from DRAM every
+    # sweep. Tile halos lag by up to one inner block (chaotic relaxation),
+    # which is harmless for a smoother.
+    N = p.shape[0]
+    TILE = 64
+    INNER = 2 if iters >= 2 else 1
+    nt = (N-2 + TILE-1)//TILE
+    for _ in range(0, iters, INNER):
+        for t in prange(nt*nt):
+            ti = t // nt; tj = t % nt
+            i0 = 1 + ti*TILE; i1 = min(i0 + TILE, N-1)
+            j0 = 1 + tj*TILE; j1 = min(j0 + TILE, N-1)
+            for _inner in range(INNER):
+                for color in range(2):
+                    for i in range(i0, i1):
+                        start = j0 + ((color + i + j0) & 1)
+                        for j in range(start, j1, 2):
+                            p[i, j] = (1.0-omega)*p[i, j] + omega*0.25*(
+                                p[i, j+1] + p[i, j-1] + p[i+1, j] + p[i-1, j]
+                                - div[i, j])
+        # Neumann boundaries
+        for i in prange(N):
+            p[i, 0] = p[i, 1]; p[i, N-1] = p[i, N-2]
+        for j in prange(N):
+            p[0, j] = p[1, j]; p[N-1, j] = p[N-2, j]
+
+def _dct_eigenvalues(N):
+    # eigenvalues of the 5-point Laplacian under Neumann BCs in DCT-II space
+    k = 2.0*(np.cos(np.pi*np.arange(N)/N) - 1.0).astype(np.float32)
+    lam = k[:, None] + k[None, :]
+    lam[0, 0] = 1.0  # avoid divide-by-zero; the DC mode is zeroed explicitly
+    return lam
+
+def fft_pressure(div, lam=None):
+    # direct Poisson solve: two DCTs and an elementwise divide replace the
+    # whole iterative sweep, and give the exact solution
+    fft = _fft_module(div)
+    if lam is None:
+        lam = _array_module(div).asarray(_dct_eigenvalues(div.shape[0]))
+    p_hat = fft.dctn(div, type=2, norm='ortho')
+    p_hat /= lam
+    p_hat[0, 0] = 0.0  # pressure is defined up to a constant
+    return fft.idctn(p_hat, type=2, norm='ortho')
+
+def project(u, v, iters=60, p=None, solver='fft', lam=None, return_norms=False,
+            div_out=None):
     enforce_no_through(u, v)
-    div = divergence(u, v)
-    p = jacobi_pressure(div, iters)
+    div = divergence(u, v, out=div_out)
+    if solver == 'fft':
+        if p is None:
+            p = fft_pressure(div, lam)
+        else:
+            p[:] = fft_pressure(div, lam)
+    else:
+        if p is None:
+            p = np.zeros_like(div)
+        _rbgs_pressure(p, div, iters, 1.3)
     u[:,1:-1] -= 0.5*(p[:,2:]-p[:,:-2])
     v[1:-1,:] -= 0.5*(p[2:,:]-p[:-2,:])
     enforce_no_through(u, v)
+    if return_norms:
+        # the pre-projection divergence is free here; callers wanting both
+        # norms avoid recomputing it themselves
+        pre = float(np.linalg.norm(div))
+        post = float(np.linalg.norm(divergence(u, v, out=div_out)))
+        return u, v, pre, post
     return u, v
 
-def curl_scalar(u, v):
-    w = np.zeros_like(u)
-    w[1:-1,1:-1] = 0.5*((v[1:-1,2:]-v[1:-1,:-2]) - (u[2:,1:-1]-u[:-2,1:-1]))
-    w[:,0]  = v[:,1]-v[:,0];   w[:, -1] = v[:,-1]-v[:,-2]
-    w[0,:] -= u[1,:]-u[0,:];   w[-1,:] -= u[-1,:]-u[-2,:]
-    return w
+def curl_scalar(u, v, out=None):
+    xp = _array_module(u)
+    u_pad = xp.pad(u, 1, mode='edge'); v_pad = xp.pad(v, 1, mode='edge')
+    if out is None:
+        out = xp.empty_like(u)
+    xp.subtract(v_pad[1:-1, 2:], v_pad[1:-1, :-2], out=out)
+    out -= u_pad[2:, 1:-1]; out += u_pad[:-2, 1:-1]
+    out *= 0.5
+    return out
+
+@njit(parallel=True, fastmath=True, cache=True)
+def _max_v2(u, v):
+    # single-pass max of u^2+v^2; no u*u+v*v temporary
+    N = u.shape[0]
+    m = np.float32(0.0)
+    for i in prange(N):
+        row = np.float32(0.0)
+        for j in range(N):
+            s = u[i, j]*u[i, j] + v[i, j]*v[i, j]
+            row = max(row, s)
+        m = max(m, row)  # numba turns this into a parallel max reduction
+    return m
+
+@njit(parallel=True, fastmath=True, cache=True)
+def _vort_conf_nb(u, v, w, strength, dt, eps0):
+    # sweep 1: curl into the scratch array (same edge-clamped scheme as
+    # curl_scalar)
+    N = u.shape[0]
+    for i in prange(N):
+        im = i-1 if i > 0 else 0
+        ip = i+1 if i < N-1 else N-1
+        for j in range(N):
+            jm = j-1 if j > 0 else 0
+            jp = j+1 if j < N-1 else N-1
+            w[i, j] = 0.5*((v[i, jp]-v[i, jm]) - (u[ip, j]-u[im, j]))
+    # sweep 2: gradient of |curl|, normalize, apply the force in place;
+    # border cells keep zero force as before
+    for i in prange(1, N-1):
+        for j in range(1, N-1):
+            gx = 0.5*(abs(w[i, j+1]) - abs(w[i, j-1]))
+            gy = 0.5*(abs(w[i+1, j]) - abs(w[i-1, j]))
+            norm = math.sqrt(gx*gx + gy*gy) + eps0
+            f = strength*w[i, j]/norm
+            u[i, j] += dt*gy*f
+            v[i, j] -= dt*gx*f
+
+@njit(parallel=True, fastmath=True, cache=True)
+def _vort_conf_vel_nb(vel, w, strength, dt, eps0):
+    # interleaved-velocity variant of _vort_conf_nb
+    N = vel.shape[0]
+    for i in prange(N):
+        im = i-1 if i > 0 else 0
+        ip = i+1 if i < N-1 else N-1
+        for j in range(N):
+            jm = j-1 if j > 0 else 0
+            jp = j+1 if j < N-1 else N-1
+            w[i, j] = 0.5*((vel[i, jp, 1]-vel[i, jm, 1])
+                         - (vel[ip, j, 0]-vel[im, j, 0]))
+    for i in prange(1, N-1):
+        for j in range(1, N-1):
+            gx = 0.5*(abs(w[i, j+1]) - abs(w[i, j-1]))
+            gy = 0.5*(abs(w[i+1, j]) - abs(w[i-1, j]))
+            norm = math.sqrt(gx*gx + gy*gy) + eps0
+            f = strength*w[i, j]/norm
+            vel[i, j, 0] += dt*gy*f
+            vel[i, j, 1] -= dt*gx*f
 
-def vorticity_confinement(u, v, strength, dt, eps0=1e-5):
+def vorticity_confinement(u, v, strength, dt, eps0=1e-5, w=None):
     if strength <= 0: return u, v
-    w = curl_scalar(u, v); mag = np.abs(w)
-    gx = np.zeros_like(mag); gy = np.zeros_like(mag)
-    gx[1:-1,1:-1] = 0.5*(mag[1:-1,2:]-mag[1:-1,:-2])
-    gy[1:-1,1:-1] = 0.5*(mag[2:,1:-1]-mag[:-2,1:-1])
-    norm = np.sqrt(gx*gx+gy*gy)+eps0
-    Nx, Ny = gx/norm, gy/norm
-    fx = strength * Ny * w
-    fy = -strength * Nx * w
-    u = u + dt*fx; v = v + dt*fy
+    xp = _array_module(u)
+    if xp is not np:
+        # vectorized path for GPU arrays; the slicing ops dispatch to cupy
+        w = curl_scalar(u, v); mag = xp.abs(w)
+        gx = xp.zeros_like(mag); gy = xp.zeros_like(mag)
+        gx[1:-1, 1:-1] = 0.5*(mag[1:-1, 2:]-mag[1:-1, :-2])
+        gy[1:-1, 1:-1] = 0.5*(mag[2:, 1:-1]-mag[:-2, 1:-1])
+        norm = xp.sqrt(gx*gx + gy*gy) + eps0
+        u = u + dt*strength*(gy/norm)*w
+        v = v - dt*strength*(gx/norm)*w
+        enforce_no_through(u, v)
+        return u, v
+    if w is None: w = np.empty_like(u)
+    _vort_conf_nb(u, v, w, np.float32(strength), np.float32(dt), np.float32(eps0))
     enforce_no_through(u, v)
     return u, v
 
 # ---------- semi-Lagrangian sampling ----------
 def _bilinear_sample(F, x, y):
-    N = F.shape[0]
-    x = np.clip(x, 0.0, N-1.001); y = np.clip(y, 0.0, N-1.001)
-    x0 = np.floor(x).astype(np.int32); y0 = np.floor(y).astype(np.int32)
-    x1 = np.clip(x0+1, 0, N-1);        y1 = np.clip(y0+1, 0, N-1)
-    wx = x - x0; wy = y - y0
-    f00 = F[y0, x0]; f10 = F[y0, x1]; f01 = F[y1, x0]; f11 = F[y1, x1]
-    return (1-wx)*(1-wy)*f00 + wx*(1-wy)*f10 + (1-wx)*wy*f01 + wx*wy*f11
-
-def advect_scalar(c, u, v, dt, diss=0.0):
+    # non-numba sampling path; mode='nearest' matches the kernels' clamping
+    # at the walls, and order=1 is plain bilinear in one compiled pass
+    # instead of the 8-temporary hand-rolled gather this used to be.
+    xp = _array_module(F)
+    coords = xp.stack([y, x]).astype(F.dtype, copy=False)
+    if xp is np:
+        return map_coordinates(F, coords, order=1, mode='nearest',
+                               prefilter=False)
+    from cupyx.scipy.ndimage import map_coordinates as cp_map_coordinates
+    return cp_map_coordinates(F, coords, order=1, mode='nearest')
+
+@njit(parallel=True, fastmath=True, nogil=True, cache=True)
+def _advect_scalar_nb(c, u, v, dt, decay, out):
+    # backtrace + clamp + bilinear gather + dissipation fused per cell: one
+    # pass over memory instead of ~8 N*N temporaries.
     N = c.shape[0]
-    Y, X = np.meshgrid(np.arange(N), np.arange(N), indexing='ij')
-    xb = X - dt*u; yb = Y - dt*v
-    out = _bilinear_sample(c, xb, yb)
-    if diss>0: out *= math.exp(-diss*dt)
-    return out
+    for i in prange(N):
+        for j in range(N):
+            x = j - dt*u[i, j]; y = i - dt*v[i, j]
+            if x < 0.0: x = 0.0
+            if x > N-1.001: x = N-1.001
+            if y < 0.0: y = 0.0
+            if y > N-1.001: y = N-1.001
+            x0 = int(math.floor(x)); y0 = int(math.floor(y))
+            wx = x - x0; wy = y - y0
+            out[i, j] = decay*((1-wx)*(1-wy)*c[y0, x0]   + wx*(1-wy)*c[y0, x0+1]
+                             + (1-wx)*wy   *c[y0+1, x0] + wx*wy   *c[y0+1, x0+1])
+
+@njit(parallel=True, fastmath=True, cache=True)
+def _advect_vec_nb(u, v, dt, decay, out_u, out_v):
+    # same as _advect_scalar_nb, but samples u and v off one shared backtrace.
+    N = u.shape[0]
+    for i in prange(N):
+        for j in range(N):
+            x = j - dt*u[i, j]; y = i - dt*v[i, j]
+            if x < 0.0: x = 0.0
+            if x > N-1.001: x = N-1.001
+            if y < 0.0: y = 0.0
+            if y > N-1.001: y = N-1.001
+            x0 = int(math.floor(x)); y0 = int(math.floor(y))
+            wx = x - x0; wy = y - y0
+            w00 = (1-wx)*(1-wy); w10 = wx*(1-wy); w01 = (1-wx)*wy; w11 = wx*wy
+            out_u[i, j] = decay*(w00*u[y0, x0]   + w10*u[y0, x0+1]
+                               + w01*u[y0+1, x0] + w11*u[y0+1, x0+1])
+            out_v[i, j] = decay*(w00*v[y0, x0]   + w10*v[y0, x0+1]
+                               + w01*v[y0+1, x0] + w11*v[y0+1, x0+1])
 
-def advect_vector(u, v, dt, diss=0.0):
+def _backtrace_coords(u, v, dt):
+    xp = _array_module(u)
     N = u.shape[0]
-    Y, X = np.meshgrid(np.arange(N), np.arange(N), indexing='ij')
-    xb = X - dt*u; yb = Y - dt*v
-    u2 = _bilinear_sample(u, xb, yb)
-    v2 = _bilinear_sample(v, xb, yb)
-    if diss>0:
-        decay = math.exp(-diss*dt); u2 *= decay; v2 *= decay
-    enforce_no_through(u2, v2)
-    return u2, v2
+    grid = xp.arange(N, dtype=u.dtype)
+    xb = grid[None, :] - dt*u
+    yb = grid[:, None] - dt*v
+    return xb, yb
+
+@njit(parallel=True, fastmath=True, cache=True)
+def _advect_vel_nb(vel, dt, decay, out_vel):
+    # interleaved-velocity variant: vel[i,j,0]/vel[i,j,1] sit 4 bytes apart,
+    # so each backtrace pulls both components off the same cache line
+    N = vel.shape[0]
+    for i in prange(N):
+        for j in range(N):
+            x = j - dt*vel[i, j, 0]; y = i - dt*vel[i, j, 1]
+            if x < 0.0: x = 0.0
+            if x > N-1.001: x = N-1.001
+            if y < 0.0: y = 0.0
+            if y > N-1.001: y = N-1.001
+            x0 = int(math.floor(x)); y0 = int(math.floor(y))
+            wx = x - x0; wy = y - y0
+            w00 = (1-wx)*(1-wy); w10 = wx*(1-wy); w01 = (1-wx)*wy; w11 = wx*wy
+            out_vel[i, j, 0] = decay*(w00*vel[y0, x0, 0]   + w10*vel[y0, x0+1, 0]
+                                    + w01*vel[y0+1, x0, 0] + w11*vel[y0+1, x0+1, 0])
+            out_vel[i, j, 1] = decay*(w00*vel[y0, x0, 1]   + w10*vel[y0, x0+1, 1]
+                                    + w01*vel[y0+1, x0, 1] + w11*vel[y0+1, x0+1, 1])
+
+def advect_scalar(c, u, v, dt, diss=0.0, out=None):
+    decay = math.exp(-diss*dt) if diss > 0 else 1.0
+    if _array_module(c) is not np:
+        xb, yb = _backtrace_coords(u, v, dt)
+        return _bilinear_sample(c, xb, yb)*c.dtype.type(decay)
+    if out is None: out = np.empty_like(c)
+    # C-contiguous inputs keep the kernel's inner j-loop unit-stride (a
+    # no-op for arrays that are already contiguous, e.g. everything the
+    # sim owns); fp32 scalars keep the arithmetic fp32 end-to-end
+    c = np.ascontiguousarray(c)
+    _advect_scalar_nb(c, np.ascontiguousarray(u), np.ascontiguousarray(v),
+                      np.float32(dt), np.float32(decay), out)
+    return out
+
+def advect_vector(u, v, dt, diss=0.0, out_u=None, out_v=None):
+    decay = math.exp(-diss*dt) if diss > 0 else 1.0
+    if _array_module(u) is not np:
+        xb, yb = _backtrace_coords(u, v, dt)
+        d = u.dtype.type(decay)
+        u2 = _bilinear_sample(u, xb, yb)*d
+        v2 = _bilinear_sample(v, xb, yb)*d
+        enforce_no_through(u2, v2)
+        return u2, v2
+    if out_u is None: out_u = np.empty_like(u)
+    if out_v is None: out_v = np.empty_like(v)
+    u = np.ascontiguousarray(u); v = np.ascontiguousarray(v)
+    _advect_vec_nb(u, v, np.float32(dt), np.float32(decay), out_u, out_v)
+    enforce_no_through(out_u, out_v)
+    return out_u, out_v
 
 # ---------- splats ----------
-def splat_scalar(c, x, y, radius, amount):
-    N = c.shape[0]; Y, X = np.meshgrid(np.arange(N), np.arange(N), indexing='ij')
+def _grid_coords(N):
+    return np.meshgrid(np.arange(N, dtype=np.float32),
+                       np.arange(N, dtype=np.float32), indexing='ij')
+
+def _splat_window(F, x, y, radius):
+    # Gaussian support is ~0 beyond 3r, so only evaluate a clipped bounding
+    # box instead of the full grid
+    xp = _array_module(F); N = F.shape[0]
     cx, cy = x*(N-1), y*(N-1); r = radius*(N-1)
-    w = np.exp(-((X-cx)**2+(Y-cy)**2)/(r*r+1e-6))
-    return c + amount*w
+    i0 = max(int(cy - 3*r), 0); i1 = min(int(cy + 3*r) + 1, N)
+    j0 = max(int(cx - 3*r), 0); j1 = min(int(cx + 3*r) + 1, N)
+    yy = xp.arange(i0, i1, dtype=F.dtype)[:, None]
+    xx = xp.arange(j0, j1, dtype=F.dtype)[None, :]
+    w = xp.exp(-((xx-cx)**2 + (yy-cy)**2)/(r*r + 1e-6))
+    return i0, i1, j0, j1, w
+
+def splat_scalar(c, x, y, radius, amount):
+    i0, i1, j0, j1, w = _splat_window(c, x, y, radius)
+    c[i0:i1, j0:j1] += amount*w
+    return c
 
 def splat_vector(u, v, x, y, radius, fx, fy):
-    N = u.shape[0]; Y, X = np.meshgrid(np.arange(N), np.arange(N), indexing='ij')
-    cx, cy = x*(N-1), y*(N-1); r = radius*(N-1)
-    w = np.exp(-((X-cx)**2+(Y-cy)**2)/(r*r+1e-6))
-    u2, v2 = u + fx*w, v + fy*w
-    enforce_no_through(u2, v2); return u2, v2
+    i0, i1, j0, j1, w = _splat_window(u, x, y, radius)
+    u[i0:i1, j0:j1] += fx*w
+    v[i0:i1, j0:j1] += fy*w
+    enforce_no_through(u, v); return u, v
+
+def splat_batched(dye, u, v, xs, ys, amounts, fxs, fys, radius=0.07,
+                  X=None, Y=None):
+    # M splats in one broadcasted pass: all Gaussians are evaluated as an
+    # (M,N,N) stack and contracted into each field with one tensordot,
+    # instead of M separate sweeps
+    xp = _array_module(dye); N = dye.shape[0]
+    if X is None:
+        Y, X = _grid_coords(N)
+    cx = xp.asarray(xs, dtype=dye.dtype)*(N-1)
+    cy = xp.asarray(ys, dtype=dye.dtype)*(N-1)
+    r = radius*(N-1)
+    w = xp.exp(-((X[None] - cx[:, None, None])**2
+               + (Y[None] - cy[:, None, None])**2)/(r*r + 1e-6))
+    dye += xp.tensordot(xp.asarray(amounts, dtype=dye.dtype), w, axes=1)
+    u += xp.tensordot(xp.asarray(fxs, dtype=u.dtype), w, axes=1)
+    v += xp.tensordot(xp.asarray(fys, dtype=v.dtype), w, axes=1)
+    enforce_no_through(u, v)
+
+# ---------- fused full-step kernel ----------
+@njit(parallel=True, fastmath=True, cache=True)
+def _enforce_nb(u, v):
+    N = u.shape[0]
+    for i in prange(N):
+        u[i, 0] = 0.0; u[i, N-1] = 0.0
+    for j in prange(N):
+        v[0, j] = 0.0; v[N-1, j] = 0.0
+
+@njit(parallel=True, fastmath=True, cache=True)
+def _divergence_nb(u, v, out):
+    # clamped-index form of the edge-padded central difference in divergence()
+    N = u.shape[0]
+    for i in prange(N):
+        im = i-1 if i > 0 else 0
+        ip = i+1 if i < N-1 else N-1
+        for j in range(N):
+            jm = j-1 if j > 0 else 0
+            jp = j+1 if j < N-1 else N-1
+            out[i, j] = 0.5*((u[i, jp]-u[i, jm]) + (v[ip, j]-v[im, j]))
+
+@njit(parallel=True, fastmath=True, cache=True)
+def _subtract_pressure_grad_nb(u, v, p):
+    N = u.shape[0]
+    for i in prange(N):
+        for j in range(1, N-1):
+            u[i, j] -= 0.5*(p[i, j+1]-p[i, j-1])
+    for i in prange(1, N-1):
+        for j in range(N):
+            v[i, j] -= 0.5*(p[i+1, j]-p[i-1, j])
+
+@njit(parallel=True, fastmath=True, cache=True)
+def _div_l2_nb(u, v):
+    # fused divergence + L2 reduction, no field materialized
+    N = u.shape[0]
+    acc = 0.0
+    for i in prange(N):
+        im = i-1 if i > 0 else 0
+        ip = i+1 if i < N-1 else N-1
+        row = 0.0
+        for j in range(N):
+            jm = j-1 if j > 0 else 0
+            jp = j+1 if j < N-1 else N-1
+            d = 0.5*((u[i, jp]-u[i, jm]) + (v[ip, j]-v[im, j]))
+            row += d*d
+        acc += row
+    return math.sqrt(acc)
+
+@njit(fastmath=True, cache=True)
+def _step_nb(vel, dye, p, vel_tmp, dye_tmp, w, div,
+             dt, vel_decay, dye_decay, vort_strength, iters, omega, eps0):
+    # one compiled call per step: all sub-kernels share the same scratch
+    # buffers and nothing escapes back to python in between
+    _advect_vel_nb(vel, dt, vel_decay, vel_tmp)
+    u_tmp = vel_tmp[:, :, 0]; v_tmp = vel_tmp[:, :, 1]
+    _enforce_nb(u_tmp, v_tmp)
+    if vort_strength > 0.0:
+        _vort_conf_vel_nb(vel_tmp, w, vort_strength, dt, eps0)
+        _enforce_nb(u_tmp, v_tmp)
+    _divergence_nb(u_tmp, v_tmp, div)
+    _rbgs_pressure(p, div, iters, omega)
+    _subtract_pressure_grad_nb(u_tmp, v_tmp, p)
+    _enforce_nb(u_tmp, v_tmp)
+    _advect_scalar_nb(dye, u_tmp, v_tmp, dt, dye_decay, dye_tmp)
+
+# ---------- simulation wrapper ----------
+class FluidSim:
+    # owns the fields plus the scratch buffers the fused kernels write into,
+    # so stepping allocates nothing.
+    def __init__(self, N=128, dt=0.08, vel_diss=0.08, dye_diss=0.12,
+                 vort_strength=6.0, iters=30, pressure_solver='fft',
+                 backend='numpy'):
+        if backend == 'cupy':
+            import cupy
+            self.xp = cupy
+            pressure_solver = 'fft'  # the rbgs kernel is CPU/numba only
+        else:
+            self.xp = np
+        xp = self.xp
+        self.N = N; self.dt = np.float32(dt)
+        self.vel_diss = vel_diss; self.dye_diss = dye_diss
+        self.vort_strength = vort_strength; self.iters = iters
+        self.pressure_solver = pressure_solver
+        # velocity components interleaved in the last axis so paired u/v
+        # reads land on the same cache line; u and v stay exposed as views
+        self.vel = xp.zeros((N, N, 2), xp.float32)
+        self.u = self.vel[..., 0]
+        self.v = self.vel[..., 1]
+        self.dye = xp.zeros((N, N), xp.float32)
+        # persisted across steps so the solver warm-starts from the previous
+        # pressure field
+        self.p = xp.zeros((N, N), xp.float32)
+        # pool of preallocated scratch buffers: every per-step operator
+        # writes into one of these, so steady-state stepping never mallocs
+        self._scratch = {name: xp.empty((N, N), xp.float32)
+                         for name in ('dye_adv', 'div', 'w',
+                                      'curl_disp', 'div_disp', 'vmag_disp')}
+        self._scratch['vel_adv'] = xp.empty((N, N, 2), xp.float32)
+        if self.xp is np:
+            # dye advection runs on a worker thread overlapped with the next
+            # velocity update; the kernel releases the GIL (nogil=True)
+            self._scratch['vel_snap'] = xp.empty((N, N, 2), xp.float32)
+            self._pool = ThreadPoolExecutor(max_workers=1)
+        self._dye_future = None
+        # full-grid coordinates, built once for helpers that sweep the whole
+        # field (splats themselves only touch a local window now)
+        self._Y, self._X = (xp.asarray(g) for g in _grid_coords(N))
+        self._lam = xp.asarray(_dct_eigenvalues(N))
+        self.divergence_history = deque(maxlen=100)  # O(1) append-and-drop
+        self._last_div_l2 = 0.0
+        self.frame = 0
+
+    def reset(self):
+        self._sync_dye()
+        self.vel[:] = 0.0; self.dye[:] = 0.0
+        self.p[:] = 0.0
+        self.divergence_history.clear()
+        self._last_div_l2 = 0.0
+        self.frame = 0
+
+    def _sync_dye(self):
+        # finish the deferred dye advection before anyone reads or writes dye
+        if self._dye_future is not None:
+            self._dye_future.result()
+            s = self._scratch
+            self.dye, s['dye_adv'] = s['dye_adv'], self.dye
+            self._dye_future = None
+
+    def add_splat(self, x, y, radius=0.07, amount=0.0, fx=0.0, fy=0.0):
+        # splats accumulate into the fields in place; no rebinding, no copies
+        self._sync_dye()
+        if amount != 0.0:
+            splat_scalar(self.dye, x, y, radius, amount)
+        if fx != 0.0 or fy != 0.0:
+            splat_vector(self.u, self.v, x, y, radius, fx, fy)
+
+    def add_splats_batched(self, xs, ys, amounts, fxs, fys, radius=0.07):
+        self._sync_dye()
+        splat_batched(self.dye, self.u, self.v, xs, ys, amounts, fxs, fys,
+                      radius, X=self._X, Y=self._Y)
+
+    def step(self):
+        self._sync_dye()
+        if self.xp is np and self.pressure_solver == 'rbgs':
+            return self._step_fused()
+        s = self._scratch
+        if self.xp is np:
+            decay = math.exp(-self.vel_diss*self.dt) if self.vel_diss > 0 else 1.0
+            _advect_vel_nb(self.vel, np.float32(self.dt), np.float32(decay),
+                           s['vel_adv'])
+            self.vel, s['vel_adv'] = s['vel_adv'], self.vel
+            self.u = self.vel[..., 0]; self.v = self.vel[..., 1]
+            enforce_no_through(self.u, self.v)
+            if self.vort_strength > 0:
+                _vort_conf_vel_nb(self.vel, s['w'],
+                                  np.float32(self.vort_strength),
+                                  np.float32(self.dt), np.float32(1e-5))
+                enforce_no_through(self.u, self.v)
+            u, v = self.u, self.v
+        else:
+            u, v = advect_vector(self.u, self.v, self.dt, diss=self.vel_diss)
+            u, v = vorticity_confinement(u, v, strength=self.vort_strength,
+                                         dt=self.dt)
+
+        u, v = project(u, v, iters=self.iters, p=self.p,
+                       solver=self.pressure_solver, lam=self._lam,
+                       div_out=s['div'])
+        if self.xp is np:
+            # s['div'] still holds the pre-projection divergence; the post
+            # norm comes from the fused reduction without materializing it
+            pre = float(np.linalg.norm(s['div']))
+            post = float(_div_l2_nb(u, v))
+        else:
+            pre = float(np.linalg.norm(s['div']))
+            post = float(np.linalg.norm(divergence(u, v, out=s['div'])))
+        assert post < pre + 1e-6, "Projection did not reduce divergence"
+
+        if self.xp is np:
+            # dye does not feed back into velocity, so its advection can
+            # overlap with whatever the caller does until the next step;
+            # snapshot the velocity since self.vel is recycled next step
+            dye_decay = math.exp(-self.dye_diss*self.dt) if self.dye_diss > 0 else 1.0
+            np.copyto(s['vel_snap'], self.vel)
+            self._dye_future = self._pool.submit(
+                _advect_scalar_nb, self.dye,
+                s['vel_snap'][..., 0], s['vel_snap'][..., 1],
+                np.float32(self.dt), np.float32(dye_decay), s['dye_adv'])
+        else:
+            self.u[:] = u; self.v[:] = v
+            self.dye = advect_scalar(self.dye, self.u, self.v, self.dt,
+                                     diss=self.dye_diss)
+
+        self._last_div_l2 = post
+        self.divergence_history.append(post)
+        self.frame += 1
+
+    def _step_fused(self):
+        # entire timestep in one compiled call (rbgs solver path); the fft
+        # solver can't run inside the kernel, so it keeps the unfused path
+        s = self._scratch
+        vel_decay = math.exp(-self.vel_diss*self.dt) if self.vel_diss > 0 else 1.0
+        dye_decay = math.exp(-self.dye_diss*self.dt) if self.dye_diss > 0 else 1.0
+        _step_nb(self.vel, self.dye, self.p,
+                 s['vel_adv'], s['dye_adv'], s['w'], s['div'],
+                 np.float32(self.dt), np.float32(vel_decay),
+                 np.float32(dye_decay), np.float32(self.vort_strength),
+                 self.iters, 1.3, np.float32(1e-5))
+        self.vel, s['vel_adv'] = s['vel_adv'], self.vel
+        self.u = self.vel[..., 0]; self.v = self.vel[..., 1]
+        self.dye, s['dye_adv'] = s['dye_adv'], self.dye
+        post = float(_div_l2_nb(self.u, self.v))
+        self._last_div_l2 = post
+        self.divergence_history.append(post)
+        self.frame += 1
+
+    def _host(self, a):
+        # device -> host copy at the display boundary; no-op on numpy
+        return a if self.xp is np else self.xp.asnumpy(a)
+
+    def get_fields(self):
+        # diagnostics land in dedicated display scratch buffers (reused each
+        # call -- consume before the next get_fields); hypot fuses the
+        # magnitude into a single ufunc pass
+        self._sync_dye()
+        s = self._scratch
+        return {
+            'dye': self._host(self.dye),
+            'vorticity': self._host(curl_scalar(self.u, self.v,
+                                                out=s['curl_disp'])),
+            'divergence': self._host(divergence(self.u, self.v,
+                                                out=s['div_disp'])),
+            'velocity_mag': self._host(self.xp.hypot(self.u, self.v,
+                                                     out=s['vmag_disp'])),
+        }
+
+    def get_display_indices(self):
+        # display-only handoff: quantize each diagnostic to its uint8
+        # colormap index at the sim boundary, so everything downstream
+        # (including the device->host copy on the cupy backend) moves bytes
+        # instead of float32
+        self._sync_dye()
+        xp = self.xp
+        s = self._scratch
+        curl_scalar(self.u, self.v, out=s['curl_disp'])
+        divergence(self.u, self.v, out=s['div_disp'])
+        xp.hypot(self.u, self.v, out=s['vmag_disp'])
+        out = {}
+        for name, f, lo, hi in (
+                ('dye', self.dye, 0.0, 1.0),
+                ('vorticity', s['curl_disp'], None, None),
+                ('divergence', s['div_disp'], None, None),
+                ('velocity_mag', s['vmag_disp'], 0.0, None)):
+            if lo is None:
+                # diverging fields map symmetrically so index 128 sits at 0
+                m = float(xp.abs(f).max()) or 1.0
+                lo, hi = -m, m
+            elif hi is None:
+                hi = float(f.max()) or 1.0
+            scale = 255.0/(hi - lo) if hi > lo else 0.0
+            idx = xp.clip((f - lo)*np.float32(scale), 0.0, 255.0)
+            out[name] = self._host(idx.astype(xp.uint8))
+        return out
+
+    def get_stats(self):
+        self._sync_dye()
+        # one reduction each, no field-sized intermediates, and the
+        # divergence norm is the one step() already computed
+        if self.xp is np:
+            m2 = float(_max_v2(self.u, self.v))
+        else:
+            m2 = float((self.u*self.u + self.v*self.v).max())
+        return {
+            'frame': self.frame,
+            'max_velocity': math.sqrt(m2),
+            'max_dye': float(self.dye.max()),
+            'divergence_l2': self._last_div_l2,
+        }
 
 # ---------- main ----------
 if __name__ == "__main__":
@@ -109,15 +668,15 @@ if __name__ == "__main__":
     u = np.zeros((N,N), np.float32); v = np.zeros((N,N), np.float32)
     dye = np.zeros((N,N), np.float32)
 
-    # seed
-    for _ in range(6):
-        x, y = rng.random(), rng.random()
-        ang = rng.random()*2*np.pi
-        u, v = splat_vector(u, v, x, y, radius=0.07, fx=np.cos(ang)*0.6, fy=np.sin(ang)*0.6)
-        dye = splat_scalar(dye, x, y, radius=0.07, amount=1.0)
+    # seed: all six splats in one batched pass
+    xs, ys = rng.random(6), rng.random(6)
+    angs = rng.random(6)*2*np.pi
+    splat_batched(dye, u, v, xs, ys, np.ones(6),
+                  np.cos(angs)*0.6, np.sin(angs)*0.6, radius=0.07)
 
     # quick projection sanity
-    u_rand = rng.standard_normal((N,N))*0.1; v_rand = rng.standard_normal((N,N))*0.1
+    u_rand = (rng.standard_normal((N,N))*0.1).astype(np.float32)
+    v_rand = (rng.standard_normal((N,N))*0.1).astype(np.float32)
     enforce_no_through(u_rand, v_rand)
     d0 = np.linalg.norm(divergence(u_rand, v_rand))
     ur, vr = project(u_rand.copy(), v_rand.copy(), iters=60)
@@ -133,10 +692,10 @@ if __name__ == "__main__":
         u, v = advect_vector(u, v, dt, diss=vel_diss)
         u, v = vorticity_confinement(u, v, strength=vort_strength, dt=dt)
 
-        # assert local decrease in divergence across projection
-        pre = np.linalg.norm(divergence(u, v))
-        u, v = project(u, v, iters=iters)
-        post = np.linalg.norm(divergence(u, v))
+        # assert local decrease in divergence across projection; project
+        # already computes the pre-projection divergence, so take both norms
+        # from it instead of running an extra stencil pass per step
+        u, v, pre, post = project(u, v, iters=iters, return_norms=True)
         assert post < pre + 1e-6, "Projection did not reduce divergence"
 
         dye = advect_scalar(dye, u, v, dt, diss=dye_diss)